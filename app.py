@@ -1,5 +1,7 @@
 from flask import Flask
-from models.database import db, Admin
+from models.database import db, Admin, upgrade_schema
+from models.audit import audit_log
+from models import consistency
 from controllers.main_controller import main_bp
 from controllers.user_controller import user_bp
 from controllers.admin_controller import admin_bp
@@ -9,6 +11,9 @@ def create_app():
     app.config['SECRET_KEY'] = 'parking-system-secret-key-2025'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///parking_system.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['OCCUPANCY_CHECK_INTERVAL'] = 300  # seconds, 0 disables the background check
+    app.config['PRICING_UTC_OFFSET'] = 5.5  # hours; lots' local time (IST) for peak/night pricing
+    app.config['QUOTE_TTL'] = 300  # seconds a price shown on the booking page stays guaranteed
     
     # Initialize database
     db.init_app(app)
@@ -21,6 +26,7 @@ def create_app():
     # Create tables and default admin
     with app.app_context():
         db.create_all()
+        upgrade_schema()
         
         # Create default admin if not exists
         if not Admin.query.filter_by(email='admin@parking.com').first():
@@ -29,6 +35,12 @@ def create_app():
             db.session.add(admin)
             db.session.commit()
     
+    # Set up the audit log; its writer thread starts with the first event
+    audit_log.init_app(app)
+    
+    # Register the occupancy check command; its schedule starts with the first request
+    consistency.init_app(app)
+    
     return app
 
 if __name__ == '__main__':
@@ -1,6 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from models.database import db, Admin, ParkingLot, ParkingSpot, User, Reservation
+from models.database import db, Admin, ParkingLot, ParkingSpot, User, Reservation, AuditEvent
+from models.pricing import discard_tariff
+from models.audit import audit_log
+from models.consistency import refresh_lot_counts, check_consistency, metrics as occupancy_metrics
+from models.bookings import invalidate_recent_bookings
 from datetime import datetime
+import re
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -29,7 +34,21 @@ def admin_dashboard():
                          occupied_spots=occupied_spots,
                          total_users=total_users,
                          active_reservations=active_reservations,
-                         total_revenue=total_revenue)
+                         total_revenue=total_revenue,
+                         occupancy_metrics=occupancy_metrics)
+
+@admin_bp.route('/admin/check-occupancy', methods=['POST'])
+def check_occupancy():
+    if 'admin_id' not in session:
+        return redirect(url_for('main.login'))
+    
+    report = check_consistency(repair=True)
+    
+    if report['mismatches']:
+        flash(f"Repaired {report['lots_repaired']} lot count(s) and {report['spots_repaired']} spot status(es)", 'success')
+    else:
+        flash(f"All {report['lots_checked']} parking lots are consistent", 'success')
+    return redirect(url_for('admin.admin_dashboard'))
 
 @admin_bp.route('/admin/parking-lots')
 def view_parking_lots():
@@ -74,6 +93,8 @@ def add_parking_lot():
             db.session.add(spot)
         
         db.session.commit()
+        audit_log.record('lot.add', 'lot', parking_lot.id,
+                         location_name=location_name, price_per_hour=price_per_hour, max_spots=max_spots)
         flash('Parking lot added successfully!', 'success')
         return redirect(url_for('admin.view_parking_lots'))
     
@@ -112,24 +133,17 @@ def edit_parking_lot(lot_id):
             for spot in spots_to_remove:
                 db.session.delete(spot)
         
-        lot.max_spots = new_max_spots
-        # Fix available spots count properly
-        _fix_lot_counts(lot)
+        db.session.flush()
+        refresh_lot_counts(lot)
         db.session.commit()
+        invalidate_recent_bookings()
+        audit_log.record('lot.edit', 'lot', lot.id,
+                         location_name=lot.location_name, price_per_hour=lot.price_per_hour, max_spots=lot.max_spots)
         flash('Parking lot updated successfully!', 'success')
         return redirect(url_for('admin.view_parking_lots'))
     
     return render_template('admin_edit_lot.html', lot=lot)
 
-def _fix_lot_counts(lot):
-    """Fix available spots count for a parking lot"""
-    total_spots = ParkingSpot.query.filter_by(lot_id=lot.id).count()
-    occupied_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='O').count()
-    lot.max_spots = total_spots
-    lot.available_spots = total_spots - occupied_spots
-    if lot.available_spots < 0:
-        lot.available_spots = 0
-
 
 
 @admin_bp.route('/admin/delete-parking-lot/<int:lot_id>')
@@ -163,6 +177,9 @@ def delete_parking_lot(lot_id):
     lot_name = lot.location_name
     db.session.delete(lot)
     db.session.commit()
+    discard_tariff(lot_id)
+    invalidate_recent_bookings()
+    audit_log.record('lot.delete', 'lot', lot_id, location_name=lot_name)
     
     flash(f'Parking lot "{lot_name}" deleted successfully!', 'success')
     return redirect(url_for('admin.view_parking_lots'))
@@ -179,6 +196,7 @@ def bulk_delete_parking_lots():
         return redirect(url_for('admin.view_parking_lots'))
     
     deleted_count = 0
+    deleted_lots = []
     failed_deletions = []
     
     for lot_id in lot_ids:
@@ -208,9 +226,14 @@ def bulk_delete_parking_lots():
         
         # Finally delete the lot
         db.session.delete(lot)
+        discard_tariff(lot.id)
+        deleted_lots.append((lot.id, lot.location_name))
         deleted_count += 1
     
     db.session.commit()
+    invalidate_recent_bookings()
+    for deleted_lot_id, location_name in deleted_lots:
+        audit_log.record('lot.delete', 'lot', deleted_lot_id, location_name=location_name)
     
     if deleted_count > 0:
         flash(f'{deleted_count} parking lot(s) deleted successfully!', 'success')
@@ -277,6 +300,45 @@ def parking_history():
                          total_revenue=total_revenue,
                          current_filter=status_filter)
 
+AUDIT_PAGE_SIZE = 50
+
+@admin_bp.route('/admin/audit-log')
+def audit_log_view():
+    if 'admin_id' not in session:
+        return redirect(url_for('main.login'))
+    
+    action_filter = request.args.get('action', '').strip()
+    actor_filter = request.args.get('actor', '').strip()
+    before = request.args.get('before', type=int)
+    
+    query = AuditEvent.query
+    if action_filter:
+        # "spot" matches every spot.* action
+        query = query.filter(db.or_(AuditEvent.action == action_filter,
+                                    AuditEvent.action.startswith(action_filter + '.', autoescape=True)))
+    if actor_filter:
+        actor_type, _, actor_id = actor_filter.partition(':')
+        query = query.filter(AuditEvent.actor_type == actor_type)
+        if actor_id.isdigit():
+            query = query.filter(AuditEvent.actor_id == int(actor_id))
+    if before:
+        query = query.filter(AuditEvent.id < before)
+    
+    events = query.order_by(AuditEvent.id.desc()).limit(AUDIT_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(events) > AUDIT_PAGE_SIZE:
+        events = events[:AUDIT_PAGE_SIZE]
+        next_cursor = events[-1].id
+    
+    return render_template('admin_audit_log.html',
+                         events=events,
+                         next_cursor=next_cursor,
+                         action_filter=action_filter,
+                         actor_filter=actor_filter,
+                         pending_events=audit_log.pending(),
+                         dropped_events=audit_log.dropped,
+                         failed_events=audit_log.failed)
+
 @admin_bp.route('/admin/view-spots/<int:lot_id>')
 def view_spots(lot_id):
     if 'admin_id' not in session:
@@ -284,11 +346,7 @@ def view_spots(lot_id):
     
     lot = ParkingLot.query.get_or_404(lot_id)
     spots = ParkingSpot.query.filter_by(lot_id=lot_id).order_by(ParkingSpot.spot_number).all()
-    
-    # Handle select all parameter
-    select_all = request.args.get('select_all') == 'true'
-    
-    return render_template('admin_view_spots.html', lot=lot, spots=spots, select_all=select_all)
+    return render_template('admin_view_spots.html', lot=lot, spots=spots)
 
 @admin_bp.route('/admin/edit-spot-form/<int:spot_id>')
 def edit_spot_form(spot_id):
@@ -320,10 +378,10 @@ def add_spot(lot_id):
     )
     
     db.session.add(new_spot)
-    lot.max_spots += 1
-    # Recalculate available spots properly
-    lot.available_spots = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').count() + 1
+    db.session.flush()
+    refresh_lot_counts(lot)
     db.session.commit()
+    audit_log.record('spot.add', 'spot', new_spot.id, lot_id=lot_id, spot_number=spot_number)
     
     flash(f'Parking spot {spot_number} added successfully!', 'success')
     return redirect(url_for('admin.view_spots', lot_id=lot_id))
@@ -350,6 +408,9 @@ def edit_spot(spot_id):
     old_number = spot.spot_number
     spot.spot_number = new_spot_number
     db.session.commit()
+    invalidate_recent_bookings()
+    audit_log.record('spot.rename', 'spot', spot.id, lot_id=spot.lot_id,
+                     old_number=old_number, new_number=new_spot_number)
     
     flash(f'Spot {old_number} renamed to {new_spot_number} successfully!', 'success')
     return redirect(url_for('admin.view_spots', lot_id=spot.lot_id))
@@ -374,16 +435,58 @@ def delete_spot(spot_id):
     
     spot_number = spot.spot_number
     db.session.delete(spot)
-    lot.max_spots -= 1
-    # Recalculate available spots properly
-    lot.available_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='A').count() - 1
-    if lot.available_spots < 0:
-        lot.available_spots = 0
+    # Recount so deleting an out-of-service spot doesn't reduce availability
+    db.session.flush()
+    refresh_lot_counts(lot)
     db.session.commit()
+    invalidate_recent_bookings()
+    audit_log.record('spot.delete', 'spot', spot_id, lot_id=lot.id, spot_number=spot_number)
     
     flash(f'Parking spot {spot_number} deleted successfully!', 'success')
     return redirect(url_for('admin.view_spots', lot_id=lot.id))
 
+SPOT_RANGE = re.compile(r'^(\D*)(\d+)-(\D*)(\d+)$')
+
+def _spot_selector(selector):
+    """Build a spot_number filter from a selector such as P001-P050, P0*, P001,P007 or ALL
+
+    Ranges compare the numeric part after a shared prefix, so P1-P100 also
+    covers unpadded numbers. Raises ValueError for a range it can't apply.
+    """
+    clauses = []
+    for part in selector.upper().replace(' ', '').split(','):
+        if not part:
+            continue
+        if part == 'ALL':
+            return db.true()
+        if '*' in part or '?' in part:
+            clauses.append(ParkingSpot.spot_number.op('GLOB')(part))
+            continue
+        
+        match = SPOT_RANGE.match(part)
+        if not match:
+            # Plain spot numbers, including ones like A-1
+            clauses.append(ParkingSpot.spot_number == part)
+            continue
+        
+        prefix, first, end_prefix, last = match.groups()
+        if end_prefix and end_prefix != prefix:
+            raise ValueError(f'Range {part} must use the same prefix on both ends')
+        if int(first) > int(last):
+            raise ValueError(f'Range {part} starts after it ends')
+        
+        number = db.func.substr(ParkingSpot.spot_number, len(prefix) + 1)
+        clauses.append(db.and_(
+            db.func.substr(ParkingSpot.spot_number, 1, len(prefix)) == prefix,
+            number != '',
+            db.not_(number.op('GLOB')('*[^0-9]*')),
+            db.cast(number, db.Integer).between(int(first), int(last))
+        ))
+    
+    if not clauses:
+        return None
+    return db.or_(*clauses)
+
 @admin_bp.route('/admin/bulk-spot-action/<int:lot_id>', methods=['POST'])
 def bulk_spot_action(lot_id):
     if 'admin_id' not in session:
@@ -391,41 +494,83 @@ def bulk_spot_action(lot_id):
     
     lot = ParkingLot.query.get_or_404(lot_id)
     action = request.form.get('action')
-    spot_ids = request.form.getlist('spot_ids')
+    selector = request.form.get('selector', '').strip()
     
-    if action == 'delete' and spot_ids:
-        spots_to_delete = ParkingSpot.query.filter(ParkingSpot.id.in_(spot_ids)).all()
-        
-        # Check if any selected spots are occupied
-        occupied_spots = [spot for spot in spots_to_delete if spot.status == 'O']
-        if occupied_spots:
-            occupied_numbers = [spot.spot_number for spot in occupied_spots]
-            flash(f'Cannot delete occupied spots: {", ".join(occupied_numbers)}', 'error')
+    try:
+        selection = _spot_selector(selector)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.view_spots', lot_id=lot_id))
+    if selection is None:
+        flash('Enter a spot selector, e.g. P001-P050, P0*, P001,P007 or ALL', 'error')
+        return redirect(url_for('admin.view_spots', lot_id=lot_id))
+    
+    selected = ParkingSpot.query.filter(ParkingSpot.lot_id == lot_id, selection)
+    # Extra audit details, recorded as actually applied
+    details = {}
+    
+    if action == 'delete':
+        occupied_count = selected.filter(ParkingSpot.status == 'O').count()
+        if occupied_count:
+            flash(f'Cannot delete {occupied_count} occupied spot(s) matching {selector}', 'error')
             return redirect(url_for('admin.view_spots', lot_id=lot_id))
         
-        # Delete all selected available spots
-        deleted_count = 0
-        for spot in spots_to_delete:
-            if spot.status == 'A':
-                # Delete reservations for this spot first
-                reservations = Reservation.query.filter_by(spot_id=spot.id).all()
-                for reservation in reservations:
-                    db.session.delete(reservation)
-                db.session.delete(spot)
-                deleted_count += 1
+        selected_ids = selected.with_entities(ParkingSpot.id).scalar_subquery()
+        Reservation.query.filter(Reservation.spot_id.in_(selected_ids)).delete(synchronize_session=False)
+        affected = selected.delete(synchronize_session=False)
+        message = f'{affected} parking spots deleted successfully!'
+    
+    elif action == 'rename':
+        old_prefix = request.form.get('old_prefix', '').upper().strip()
+        new_prefix = request.form.get('new_prefix', '').upper().strip()
+        if not old_prefix or not new_prefix:
+            flash('Both the current and the new prefix are required to rename spots', 'error')
+            return redirect(url_for('admin.view_spots', lot_id=lot_id))
         
-        lot.max_spots -= deleted_count
-        # Recalculate available spots properly
-        remaining_spots = ParkingSpot.query.filter_by(lot_id=lot_id).count() - deleted_count
-        occupied_spots_count = ParkingSpot.query.filter_by(lot_id=lot_id, status='O').count()
-        lot.available_spots = remaining_spots - occupied_spots_count
-        if lot.available_spots < 0:
-            lot.available_spots = 0
+        selected = selected.filter(ParkingSpot.spot_number.startswith(old_prefix, autoescape=True))
+        new_number = db.literal(new_prefix) + db.func.substr(ParkingSpot.spot_number, len(old_prefix) + 1)
         
-        db.session.commit()
+        # Refuse renames that would collide with a spot outside the selection
+        other = db.aliased(ParkingSpot)
+        collisions = selected.join(other, db.and_(
+            other.lot_id == ParkingSpot.lot_id,
+            other.spot_number == new_number,
+            other.id != ParkingSpot.id
+        )).count()
+        if collisions:
+            flash(f'Renaming {old_prefix}* to {new_prefix}* would duplicate {collisions} existing spot number(s)', 'error')
+            return redirect(url_for('admin.view_spots', lot_id=lot_id))
         
-        flash(f'{deleted_count} parking spots deleted successfully!', 'success')
+        affected = selected.update({ParkingSpot.spot_number: new_number}, synchronize_session=False)
+        details = {'old_prefix': old_prefix, 'new_prefix': new_prefix}
+        message = f'{affected} parking spots renamed from {old_prefix}* to {new_prefix}*'
+    
+    elif action == 'maintenance':
+        affected = selected.filter(ParkingSpot.status == 'A').update(
+            {ParkingSpot.status: 'M'}, synchronize_session=False)
+        message = f'{affected} parking spots marked out of service'
+    
+    elif action == 'restore':
+        affected = selected.filter(ParkingSpot.status == 'M').update(
+            {ParkingSpot.status: 'A'}, synchronize_session=False)
+        message = f'{affected} parking spots returned to service'
+    
+    elif action == 'zone':
+        zone = request.form.get('zone', '').upper().strip() or None
+        affected = selected.update({ParkingSpot.zone: zone}, synchronize_session=False)
+        details = {'zone': zone}
+        message = f'{affected} parking spots assigned to zone {zone or "(none)"}'
+    
+    else:
+        flash('Unknown bulk action', 'error')
+        return redirect(url_for('admin.view_spots', lot_id=lot_id))
+    
+    refresh_lot_counts(lot)
+    db.session.commit()
+    invalidate_recent_bookings()
+    audit_log.record(f'spot.bulk_{action}', 'lot', lot_id, selector=selector, affected=affected, **details)
     
+    flash(message, 'success')
     return redirect(url_for('admin.view_spots', lot_id=lot_id))
 
 @admin_bp.route('/admin/confirm-delete-parking-lot/<int:lot_id>')
@@ -1,9 +1,61 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app
 from models.database import db, User, ParkingLot, ParkingSpot, Reservation
+from models.pricing import quote_rate
+from models.audit import audit_log
+from models.bookings import booking_rows_query, get_recent_bookings, invalidate_recent_bookings
 from datetime import datetime
+import time
 
 user_bp = Blueprint('user', __name__)
 
+HISTORY_PAGE_SIZE = 20
+
+def _issue_quote(lot):
+    """Quote the lot's current rate and remember it in the session for booking"""
+    rate = quote_rate(lot)
+    session['quote'] = {'lot_id': lot.id, 'rate': rate, 'issued_at': time.time()}
+    return rate
+
+def _honoured_quote(lot):
+    """The rate the user was shown for this lot, if it can still be honoured
+
+    A quote is honoured until QUOTE_TTL expires; after that only if the
+    current rate hasn't changed, so nobody is billed a rate they never saw.
+    """
+    quote = session.get('quote')
+    if not quote or quote['lot_id'] != lot.id:
+        return None
+    if time.time() - quote['issued_at'] <= current_app.config.get('QUOTE_TTL', 300):
+        return quote['rate']
+    if quote_rate(lot) == quote['rate']:
+        return quote['rate']
+    return None
+
+def _month_summaries(user_id, rows):
+    """Per-month booking count, hours and spend for the months covered by rows"""
+    if not rows:
+        return []
+    
+    oldest = min(row.start_time for row in rows)
+    newest = max(row.start_time for row in rows)
+    range_start = datetime(oldest.year, oldest.month, 1)
+    if newest.month == 12:
+        range_end = datetime(newest.year + 1, 1, 1)
+    else:
+        range_end = datetime(newest.year, newest.month + 1, 1)
+    
+    month = db.func.strftime('%Y-%m', Reservation.start_time)
+    duration_hours = (db.func.julianday(Reservation.end_time) - db.func.julianday(Reservation.start_time)) * 24
+    return db.session.query(
+        month.label('month'),
+        db.func.count(Reservation.id).label('bookings'),
+        db.func.coalesce(db.func.sum(duration_hours), 0).label('hours'),
+        db.func.coalesce(db.func.round(db.func.sum(Reservation.total_cost), 2), 0).label('spent')
+    ).filter(
+        Reservation.user_id == user_id,
+        Reservation.start_time >= range_start,
+        Reservation.start_time < range_end
+    ).group_by(month).order_by(month.desc()).all()
 
 
 @user_bp.route('/dashboard')
@@ -12,8 +64,9 @@ def dashboard():
         return redirect(url_for('main.login'))
     
     user_id = session['user_id']
-    active_reservation = Reservation.query.filter_by(user_id=user_id, status='Active').first()
-    recent_reservations = Reservation.query.filter_by(user_id=user_id).order_by(Reservation.created_at.desc()).limit(5).all()
+    # Always read the active booking fresh; it may have changed in another worker
+    active_reservation = booking_rows_query(user_id).filter(Reservation.status == 'Active').first()
+    recent_reservations = get_recent_bookings(user_id)
     
     return render_template('user_dashboard.html', 
                          active_reservation=active_reservation,
@@ -25,7 +78,8 @@ def book_parking():
         return redirect(url_for('main.login'))
     
     lots = ParkingLot.query.filter(ParkingLot.available_spots > 0).all()
-    return render_template('book_parking.html', lots=lots)
+    quotes = {lot.id: quote_rate(lot) for lot in lots}
+    return render_template('book_parking.html', lots=lots, quotes=quotes)
 
 @user_bp.route('/book-spot/<int:lot_id>', methods=['GET', 'POST'])
 def book_spot(lot_id):
@@ -49,35 +103,44 @@ def book_spot(lot_id):
         existing_vehicle_reservation = Reservation.query.filter_by(vehicle_number=vehicle_number, status='Active').first()
         if existing_vehicle_reservation:
             flash(f'Vehicle {vehicle_number} is already parked. Only one active booking per vehicle allowed.', 'error')
-            return render_template('book_spot.html', lot=lot)
+            return render_template('book_spot.html', lot=lot, quoted_rate=_issue_quote(lot))
+        
+        hourly_rate = _honoured_quote(lot)
+        if hourly_rate is None:
+            flash('The price for this lot has changed. Please confirm the new rate.', 'error')
+            return render_template('book_spot.html', lot=lot, quoted_rate=_issue_quote(lot))
         
-        # Find available spot
+        # Find available spot (spots under maintenance are never allocated)
         available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
         if not available_spot:
             flash('No available spots in this parking lot', 'error')
             return redirect(url_for('user.book_parking'))
         
-        # Create reservation
+        # Create reservation with the quoted rate locked in
         reservation = Reservation(
             user_id=user_id,
             spot_id=available_spot.id,
             vehicle_number=vehicle_number,
+            hourly_rate=hourly_rate,
             status='Active'
         )
         
-        # Update spot status and recalculate available spots
+        # Update spot status; the decrement runs in SQL so concurrent bookings can't lose updates
         available_spot.status = 'O'
-        lot.available_spots = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').count() - 1
-        if lot.available_spots < 0:
-            lot.available_spots = 0
+        lot.available_spots = ParkingLot.available_spots - 1
         
         db.session.add(reservation)
         db.session.commit()
+        session.pop('quote', None)
+        invalidate_recent_bookings(user_id)
+        audit_log.record('reservation.book', 'reservation', reservation.id,
+                         lot_id=lot_id, spot_id=available_spot.id,
+                         vehicle_number=vehicle_number, hourly_rate=reservation.hourly_rate)
         
         flash(f'Parking spot {available_spot.spot_number} booked successfully!', 'success')
         return redirect(url_for('user.dashboard'))
     
-    return render_template('book_spot.html', lot=lot)
+    return render_template('book_spot.html', lot=lot, quoted_rate=_issue_quote(lot))
 
 @user_bp.route('/release-parking/<int:reservation_id>')
 def release_parking(reservation_id):
@@ -97,20 +160,23 @@ def release_parking(reservation_id):
         duration_hours = 1  # Minimum 1 hour charge
     
     lot = reservation.parking_spot.parking_lot
-    total_cost = duration_hours * lot.price_per_hour
+    # Bookings made before rates were locked in fall back to the lot's base price
+    hourly_rate = reservation.hourly_rate if reservation.hourly_rate is not None else lot.price_per_hour
+    total_cost = duration_hours * hourly_rate
     
     # Update reservation
     reservation.end_time = datetime.utcnow()
     reservation.total_cost = round(total_cost, 2)
     reservation.status = 'Completed'
     
-    # Update spot and recalculate available spots properly
+    # Free the spot; any drift in the count is repaired by the occupancy checker
     reservation.parking_spot.status = 'A'
-    lot.available_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='A').count() + 1
-    if lot.available_spots > lot.max_spots:
-        lot.available_spots = lot.max_spots
+    lot.available_spots = ParkingLot.available_spots + 1
     
     db.session.commit()
+    invalidate_recent_bookings(user_id)
+    audit_log.record('reservation.release', 'reservation', reservation.id,
+                     lot_id=lot.id, spot_id=reservation.spot_id, total_cost=reservation.total_cost)
     
     flash(f'Parking released successfully! Total cost: ₹{reservation.total_cost}', 'success')
     return redirect(url_for('user.dashboard'))
@@ -121,7 +187,22 @@ def booking_history():
         return redirect(url_for('main.login'))
     
     user_id = session['user_id']
-    reservations = Reservation.query.filter_by(user_id=user_id).order_by(Reservation.created_at.desc()).all()
-    
-    return render_template('booking_history.html', reservations=reservations)
+    before = request.args.get('before', type=int)
+    
+    # Keyset pagination on the reservation id, newest first
+    query = booking_rows_query(user_id)
+    if before:
+        query = query.filter(Reservation.id < before)
+    rows = query.order_by(Reservation.id.desc()).limit(HISTORY_PAGE_SIZE + 1).all()
+    
+    next_cursor = None
+    if len(rows) > HISTORY_PAGE_SIZE:
+        rows = rows[:HISTORY_PAGE_SIZE]
+        next_cursor = rows[-1].id
+    
+    return render_template('booking_history.html',
+                         reservations=rows,
+                         month_summaries=_month_summaries(user_id, rows),
+                         next_cursor=next_cursor,
+                         is_first_page=not before)
 
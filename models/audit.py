@@ -0,0 +1,128 @@
+import atexit
+import json
+import queue
+import threading
+from datetime import datetime
+from flask import session, has_request_context
+from models.database import db, AuditEvent
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0  # seconds
+ENQUEUE_TIMEOUT = 0.05  # seconds a request waits on a full queue before the event is dropped
+
+class AuditLog:
+    """Append-only event log written behind the request by a background thread.
+
+    Controllers call record() after committing; events are queued in memory
+    and inserted into the audit_event table in batches, so audit writes never
+    extend the request's own transaction. The writer thread starts with the
+    first event, so processes that never record one (such as the debug
+    reloader's watcher) never run a writer.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self.dropped = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        # Re-initialising (e.g. another create_app() in the same process) drains the old writer first
+        self.shutdown()
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config.get('AUDIT_QUEUE_SIZE', QUEUE_SIZE))
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    def record(self, action, target_type=None, target_id=None, **details):
+        """Queue an event, attributed to whoever is logged in"""
+        if self.queue is None:
+            return
+
+        actor_type, actor_id = 'system', None
+        if has_request_context():
+            if 'admin_id' in session:
+                actor_type, actor_id = 'admin', session['admin_id']
+            elif 'user_id' in session:
+                actor_type, actor_id = 'user', session['user_id']
+
+        event = {
+            'created_at': datetime.utcnow(),
+            'actor_type': actor_type,
+            'actor_id': actor_id,
+            'action': action,
+            'target_type': target_type,
+            'target_id': target_id,
+            'details': json.dumps(details, default=str) if details else None
+        }
+
+        self._start_writer()
+
+        # Backpressure: wait briefly for the writer, then drop rather than stall the request
+        try:
+            self.queue.put(event, timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self.dropped += 1
+
+    def pending(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def flush(self):
+        """Write everything currently queued"""
+        if self.queue is None:
+            return
+        while True:
+            batch = self._take_batch(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self):
+        """Stop the writer thread and flush what is left in the queue"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=10)
+        self.flush()
+
+    def _start_writer(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take_batch(block=True)
+            if batch:
+                self._write(batch)
+
+    def _take_batch(self, block):
+        batch = []
+        try:
+            if block:
+                batch.append(self.queue.get(timeout=FLUSH_INTERVAL))
+            while len(batch) < BATCH_SIZE:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(AuditEvent.__table__.insert(), batch)
+        except Exception:
+            self.failed += len(batch)
+            self.app.logger.exception('Failed to write %d audit events', len(batch))
+
+audit_log = AuditLog()
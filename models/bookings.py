@@ -0,0 +1,61 @@
+from collections import OrderedDict
+import threading
+import time
+from models.database import db, ParkingLot, ParkingSpot, Reservation
+
+RECENT_BOOKINGS_LIMIT = 5
+RECENT_BOOKINGS_TTL = 300  # seconds
+RECENT_BOOKINGS_MAX_USERS = 10000
+
+# user_id -> (cached_at, rows) for the dashboard's recent bookings list, least recently used first.
+# The cache is per process, so with several workers the list can lag by up to the TTL;
+# anything that must be current (like the active booking) is queried directly.
+_recent_bookings_cache = OrderedDict()
+_recent_bookings_lock = threading.Lock()
+
+def booking_rows_query(user_id):
+    """Compact reservation rows with lot/spot data and duration joined in SQL"""
+    duration_hours = (db.func.julianday(Reservation.end_time) - db.func.julianday(Reservation.start_time)) * 24
+    return db.session.query(
+        Reservation.id,
+        Reservation.vehicle_number,
+        Reservation.start_time,
+        Reservation.end_time,
+        db.func.round(Reservation.total_cost, 2).label('total_cost'),
+        Reservation.status,
+        ParkingSpot.spot_number,
+        ParkingLot.location_name,
+        db.func.coalesce(Reservation.hourly_rate, ParkingLot.price_per_hour).label('hourly_rate'),
+        duration_hours.label('duration_hours')
+    ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id
+    ).join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).filter(Reservation.user_id == user_id)
+
+def get_recent_bookings(user_id):
+    """Return the user's most recent bookings, cached per user"""
+    now = time.monotonic()
+    with _recent_bookings_lock:
+        cached = _recent_bookings_cache.get(user_id)
+        if cached and now - cached[0] < RECENT_BOOKINGS_TTL:
+            _recent_bookings_cache.move_to_end(user_id)
+            return cached[1]
+    
+    rows = booking_rows_query(user_id).order_by(Reservation.id.desc()).limit(RECENT_BOOKINGS_LIMIT).all()
+    with _recent_bookings_lock:
+        _recent_bookings_cache[user_id] = (now, rows)
+        _recent_bookings_cache.move_to_end(user_id)
+        # Evict expired entries from the cold end, then anything beyond the size cap
+        while _recent_bookings_cache:
+            oldest_user, (cached_at, _) = next(iter(_recent_bookings_cache.items()))
+            if now - cached_at < RECENT_BOOKINGS_TTL and len(_recent_bookings_cache) <= RECENT_BOOKINGS_MAX_USERS:
+                break
+            del _recent_bookings_cache[oldest_user]
+    return rows
+
+def invalidate_recent_bookings(user_id=None):
+    """Drop cached recent bookings for one user, or for everyone"""
+    with _recent_bookings_lock:
+        if user_id is None:
+            _recent_bookings_cache.clear()
+        else:
+            _recent_bookings_cache.pop(user_id, None)
@@ -0,0 +1,202 @@
+import sys
+import threading
+import time
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from models.database import db, ParkingLot, ParkingSpot, Reservation
+from models.audit import audit_log
+
+CHECK_INTERVAL = 300  # seconds
+
+# Cumulative counters plus the most recent report, shown on the admin dashboard
+metrics = {
+    'runs': 0,
+    'lots_repaired': 0,
+    'spots_repaired': 0,
+    'last_report': None
+}
+
+def _active_spot_ids():
+    return db.session.query(Reservation.spot_id).filter(Reservation.status == 'Active')
+
+def lot_count_rows(lot_ids=None):
+    """Stored and actual counts for each lot from a single grouped aggregate query.
+
+    A spot counts as reserved when it has an Active reservation. Spots marked
+    occupied without one, or reserved but not marked occupied, are drift.
+    """
+    active = _active_spot_ids().distinct().subquery()
+    reserved = active.c.spot_id.isnot(None)
+    unreserved = active.c.spot_id.is_(None)
+    query = db.session.query(
+        ParkingLot.id.label('lot_id'),
+        ParkingLot.max_spots,
+        ParkingLot.available_spots,
+        db.func.coalesce(ParkingLot.out_of_service_spots, 0).label('out_of_service_spots'),
+        db.func.count(ParkingSpot.id).label('total_spots'),
+        db.func.sum(db.case((ParkingSpot.status == 'A', 1), else_=0)).label('status_available'),
+        db.func.sum(db.case((ParkingSpot.status == 'M', 1), else_=0)).label('status_maintenance'),
+        db.func.sum(db.case((db.and_(ParkingSpot.status == 'O', unreserved), 1), else_=0)).label('occupied_unreserved'),
+        db.func.sum(db.case((db.and_(ParkingSpot.status != 'O', reserved), 1), else_=0)).label('reserved_unoccupied'),
+        db.func.sum(db.case((db.and_(ParkingSpot.status != 'M', unreserved), 1), else_=0)).label('expected_available')
+    ).outerjoin(ParkingSpot, ParkingSpot.lot_id == ParkingLot.id
+    ).outerjoin(active, active.c.spot_id == ParkingSpot.id
+    ).group_by(ParkingLot.id)
+    if lot_ids is not None:
+        query = query.filter(ParkingLot.id.in_(lot_ids))
+    return query.all()
+
+def refresh_lot_counts(*lots):
+    """Set max/available/out-of-service spots on the given lots from their spots' current status"""
+    rows = {row.lot_id: row for row in lot_count_rows([lot.id for lot in lots])}
+    for lot in lots:
+        row = rows[lot.id]
+        lot.max_spots = row.total_spots
+        lot.available_spots = row.status_available
+        lot.out_of_service_spots = row.status_maintenance
+
+def check_consistency(repair=True):
+    """Compare stored lot counts and spot status with Active reservations.
+
+    With repair, spot status is corrected from the reservations and drifted
+    lot counts are rewritten in one executemany. Each lot update only applies
+    if its stored counts are unchanged since the check, so a booking made in
+    between is never overwritten; the next run picks that lot up again.
+    """
+    started = time.perf_counter()
+    rows = lot_count_rows()
+
+    mismatches = []
+    for row in rows:
+        if (row.max_spots != row.total_spots or row.available_spots != row.expected_available
+                or row.out_of_service_spots != row.status_maintenance
+                or row.occupied_unreserved or row.reserved_unoccupied):
+            mismatches.append({
+                'lot_id': row.lot_id,
+                'stored_max': row.max_spots,
+                'actual_max': row.total_spots,
+                'stored_available': row.available_spots,
+                'actual_available': row.expected_available,
+                'stored_out_of_service': row.out_of_service_spots,
+                'actual_out_of_service': row.status_maintenance,
+                'occupied_unreserved': row.occupied_unreserved,
+                'reserved_unoccupied': row.reserved_unoccupied
+            })
+
+    spots_drifted = sum(m['occupied_unreserved'] + m['reserved_unoccupied'] for m in mismatches)
+    lots_repaired = 0
+    spots_repaired = 0
+
+    if repair and mismatches:
+        if spots_drifted:
+            active = _active_spot_ids()
+            spots_repaired += ParkingSpot.query.filter(
+                ParkingSpot.status == 'O', ParkingSpot.id.notin_(active)
+            ).update({ParkingSpot.status: 'A'}, synchronize_session=False)
+            spots_repaired += ParkingSpot.query.filter(
+                ParkingSpot.status != 'O', ParkingSpot.id.in_(active)
+            ).update({ParkingSpot.status: 'O'}, synchronize_session=False)
+
+        # Lots listed only for spot-status drift already have correct stored counts
+        count_drift = [m for m in mismatches
+                       if (m['stored_max'], m['stored_available'], m['stored_out_of_service'])
+                       != (m['actual_max'], m['actual_available'], m['actual_out_of_service'])]
+        if count_drift:
+            lots = ParkingLot.__table__
+            result = db.session.execute(
+                lots.update().where(db.and_(
+                    lots.c.id == db.bindparam('lot_id'),
+                    lots.c.max_spots == db.bindparam('stored_max'),
+                    lots.c.available_spots == db.bindparam('stored_available'),
+                    db.func.coalesce(lots.c.out_of_service_spots, 0) == db.bindparam('stored_out_of_service')
+                )).values(
+                    max_spots=db.bindparam('actual_max'),
+                    available_spots=db.bindparam('actual_available'),
+                    out_of_service_spots=db.bindparam('actual_out_of_service')
+                ),
+                count_drift
+            )
+            lots_repaired = result.rowcount if result.rowcount >= 0 else len(count_drift)
+        db.session.commit()
+
+        audit_log.record('occupancy.repair', lots_repaired=lots_repaired, spots_repaired=spots_repaired,
+                         lot_ids=[m['lot_id'] for m in mismatches])
+
+    report = {
+        'checked_at': datetime.utcnow(),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        'lots_checked': len(rows),
+        'lots_drifted': len(mismatches),
+        'spots_drifted': spots_drifted,
+        'lots_repaired': lots_repaired,
+        'spots_repaired': spots_repaired,
+        'repaired': repair,
+        'mismatches': mismatches
+    }
+
+    metrics['runs'] += 1
+    metrics['lots_repaired'] += lots_repaired
+    metrics['spots_repaired'] += spots_repaired
+    metrics['last_report'] = report
+    return report
+
+@click.command('check-occupancy')
+@click.option('--dry-run', is_flag=True, help='Report drift without repairing it.')
+@with_appcontext
+def check_occupancy_command(dry_run):
+    """Check parking lot counts against spots and reservations."""
+    report = check_consistency(repair=not dry_run)
+
+    click.echo(f"Checked {report['lots_checked']} lots in {report['duration_ms']} ms: "
+               f"{report['lots_drifted']} lots and {report['spots_drifted']} spots drifted")
+    for m in report['mismatches']:
+        click.echo(f"  lot {m['lot_id']}: max {m['stored_max']} -> {m['actual_max']}, "
+                   f"available {m['stored_available']} -> {m['actual_available']}, "
+                   f"out of service {m['stored_out_of_service']} -> {m['actual_out_of_service']}, "
+                   f"{m['occupied_unreserved']} occupied without reservation, "
+                   f"{m['reserved_unoccupied']} reserved but not occupied")
+    if not dry_run:
+        click.echo(f"Repaired {report['lots_repaired']} lots and {report['spots_repaired']} spots")
+    elif report['mismatches']:
+        sys.exit(1)
+
+def _run_scheduled(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                report = check_consistency(repair=True)
+                if report['mismatches']:
+                    app.logger.warning('Repaired occupancy drift in %d lots', report['lots_repaired'])
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Occupancy consistency check failed')
+            finally:
+                db.session.remove()
+
+_scheduler_lock = threading.Lock()
+_scheduler_thread = None
+
+def start_scheduler(app):
+    """Start the periodic checker once per process"""
+    global _scheduler_thread
+    interval = app.config.get('OCCUPANCY_CHECK_INTERVAL', CHECK_INTERVAL)
+    if not interval:
+        return
+    with _scheduler_lock:
+        if _scheduler_thread is None:
+            _scheduler_thread = threading.Thread(target=_run_scheduled, args=(app, interval),
+                                                 name='occupancy-checker', daemon=True)
+            _scheduler_thread.start()
+
+def init_app(app):
+    """Register the CLI command and start the periodic checker when serving"""
+    app.cli.add_command(check_occupancy_command)
+
+    # Starting with the first request keeps the checker out of CLI commands
+    # and the debug reloader's watcher process, which never serve requests
+    @app.before_request
+    def _start_occupancy_scheduler():
+        if _scheduler_thread is None:
+            start_scheduler(app)
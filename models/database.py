@@ -41,25 +41,68 @@ class ParkingLot(db.Model):
     price_per_hour = db.Column(db.Float, nullable=False)
     max_spots = db.Column(db.Integer, nullable=False)
     available_spots = db.Column(db.Integer, nullable=False)
+    out_of_service_spots = db.Column(db.Integer, default=0)  # Spots under maintenance
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     spots = db.relationship('ParkingSpot', backref='parking_lot', lazy=True, cascade='all, delete-orphan')
+    
+    @property
+    def in_service_spots(self):
+        return self.max_spots - (self.out_of_service_spots or 0)
+    
+    @property
+    def occupied_spots(self):
+        return self.in_service_spots - self.available_spots
 
 class ParkingSpot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     spot_number = db.Column(db.String(10), nullable=False)
-    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
-    status = db.Column(db.String(1), default='A', nullable=False)  # A=Available, O=Occupied
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False, index=True)
+    status = db.Column(db.String(1), default='A', nullable=False)  # A=Available, O=Occupied, M=Maintenance
+    zone = db.Column(db.String(20))
     
     reservations = db.relationship('Reservation', backref='parking_spot', lazy=True, cascade='all, delete-orphan')
 
 class Reservation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
     vehicle_number = db.Column(db.String(20), nullable=False)
     start_time = db.Column(db.DateTime, default=datetime.utcnow)
     end_time = db.Column(db.DateTime)
     total_cost = db.Column(db.Float, default=0.0)
-    status = db.Column(db.String(20), default='Active')  # Active, Completed
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    hourly_rate = db.Column(db.Float)  # Rate quoted and locked in at booking
+    status = db.Column(db.String(20), default='Active', index=True)  # Active, Completed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class AuditEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    actor_type = db.Column(db.String(10), nullable=False)  # user, admin, system
+    actor_id = db.Column(db.Integer)
+    action = db.Column(db.String(50), nullable=False, index=True)
+    target_type = db.Column(db.String(20))
+    target_id = db.Column(db.Integer)
+    details = db.Column(db.Text)  # JSON encoded
+
+def upgrade_schema():
+    """Bring an existing database up to date with the models.
+
+    db.create_all() only creates missing tables, so nullable columns and
+    indexes added to existing tables have to be created here.
+    """
+    inspector = db.inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    for table in db.metadata.sorted_tables:
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(db.text(
+                    f'ALTER TABLE {preparer.format_table(table)} '
+                    f'ADD COLUMN {preparer.format_column(column)} {column_type}'
+                ))
+        db.session.commit()
+        
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from flask import current_app
+
+# (minimum occupancy ratio, multiplier), checked from the busiest band down
+OCCUPANCY_BANDS = [
+    (0.9, 1.5),
+    (0.75, 1.25),
+    (0.5, 1.1),
+    (0.0, 1.0),
+]
+
+# Peak and night hours are local to the lots; PRICING_UTC_OFFSET (hours) sets the zone
+DEFAULT_UTC_OFFSET = 0
+PEAK_HOURS = set(range(8, 11)) | set(range(17, 21))
+NIGHT_HOURS = set(range(22, 24)) | set(range(0, 6))
+PEAK_MULTIPLIER = 1.2
+NIGHT_MULTIPLIER = 0.8
+
+# lot_id -> (price, available, max, out of service, hourly rates for 0-23)
+_tariff_tables = {}
+
+def occupancy_multiplier(lot):
+    """Surge multiplier for the lot's current occupancy, ignoring spots under maintenance"""
+    in_service = lot.in_service_spots
+    if in_service <= 0:
+        return 1.0
+    occupancy = 1 - lot.available_spots / in_service
+    for threshold, multiplier in OCCUPANCY_BANDS:
+        if occupancy >= threshold:
+            return multiplier
+    return 1.0
+
+def local_now():
+    """Current time in the zone peak and night hours are defined in"""
+    offset = current_app.config.get('PRICING_UTC_OFFSET', DEFAULT_UTC_OFFSET)
+    return datetime.utcnow() + timedelta(hours=offset)
+
+def hour_multiplier(hour):
+    """Time of day multiplier for the given hour"""
+    if hour in PEAK_HOURS:
+        return PEAK_MULTIPLIER
+    if hour in NIGHT_HOURS:
+        return NIGHT_MULTIPLIER
+    return 1.0
+
+def refresh_tariff(lot):
+    """Rebuild the 24 hour tariff table for a lot from its current occupancy"""
+    surge = occupancy_multiplier(lot)
+    rates = [round(lot.price_per_hour * surge * hour_multiplier(hour), 2) for hour in range(24)]
+    _tariff_tables[lot.id] = (lot.price_per_hour, lot.available_spots, lot.max_spots, lot.out_of_service_spots, rates)
+    return rates
+
+def discard_tariff(lot_id):
+    """Forget the tariff table of a deleted lot"""
+    _tariff_tables.pop(lot_id, None)
+
+def quote_rate(lot, at=None):
+    """Hourly rate for parking at the lot right now (or at the given local time)
+
+    Uses the cached tariff table, rebuilding it only when the lot's price or
+    occupancy has changed since it was built, so no queries are issued.
+    """
+    at = at or local_now()
+    cached = _tariff_tables.get(lot.id)
+    if cached and cached[:4] == (lot.price_per_hour, lot.available_spots, lot.max_spots, lot.out_of_service_spots):
+        rates = cached[4]
+    else:
+        rates = refresh_tariff(lot)
+    return rates[at.hour]